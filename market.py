@@ -1,15 +1,71 @@
 """Скрипт предназанчен для автоматического обновленя цен на маркетплейсе Яндекс Маркет."""
+import asyncio
 import datetime
+import functools
+from concurrent.futures import ThreadPoolExecutor
 import logging.config
 from environs import Env
 from seller import download_stock
 
+import aiohttp
+import orjson
 import requests
 
-from seller import divide, price_conversion
+from seller import (
+    make_session,
+    price_to_int,
+    remnants_by_code,
+    stock_conversion,
+    upload_chunks,
+)
 
 logger = logging.getLogger(__file__)
 
+YM_BASE_URL = "https://api.partner.market.yandex.ru"
+
+SESSION = make_session()
+SESSION.headers.update(
+    {
+        "Content-Type": "application/json",
+        "Accept": "application/json",
+    }
+)
+
+
+@functools.lru_cache(maxsize=32)
+def campaign_url(campaign_id, path):
+    """Возвращает адрес метода API Яндекс.Маркета для кампании.
+
+    Аргументы:
+        campaign_id(str): Идентификатор кампании.
+        path(str): Путь метода внутри кампании.
+
+    Возвращаемое значение:
+        str: полный адрес метода.
+        Пример:
+        >>> campaign_url('123', 'offers/stocks')
+        'https://api.partner.market.yandex.ru/campaigns/123/offers/stocks'
+    """
+    return f"{YM_BASE_URL}/campaigns/{campaign_id}/{path}"
+
+
+@functools.lru_cache(maxsize=8)
+def auth_headers(access_token):
+    """Возвращает заголовок авторизации для API Яндекс.Маркета.
+
+    Словарь кэшируется и не должен изменяться вызывающим кодом.
+
+    Аргументы:
+        access_token(str): Токен доступа к API.
+
+    Возвращаемое значение:
+        dict: с заголовком Authorization.
+        Пример:
+        >>> auth_headers('token')
+        {'Authorization': 'Bearer token'}
+    """
+    return {"Authorization": f"Bearer {access_token}"}
+
 
 def get_product_list(page, campaign_id, access_token):
     """Получает список товаров из магазина Яндекс.Маркета.
@@ -38,30 +94,24 @@ def get_product_list(page, campaign_id, access_token):
         requests.exceptions.RequestException: При ошибках сетевого запроса.
         HTTPError: При HTTP-ошибках (например, 400, 401, 500).
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
     payload = {
         "page_token": page,
         "limit": 200,
     }
-    url = endpoint_url + f"campaigns/{campaign_id}/offer-mapping-entries"
-    response = requests.get(url, headers=headers, params=payload)
+    url = campaign_url(campaign_id, "offer-mapping-entries")
+    response = SESSION.get(url, headers=auth_headers(access_token), params=payload)
     response.raise_for_status()
-    response_object = response.json()
+    response_object = orjson.loads(response.content)
     return response_object.get("result")
 
 
-def update_stocks(stocks, campaign_id, access_token):
+async def update_stocks(session, stocks, campaign_id, access_token):
     """Обновляет остатки товаров на Яндекс.Маркете.
 
     Функция отправляет запрос на обновление остатков товаров через API Яндекс.Маркета.
 
     Аргументы:
+        session(aiohttp.ClientSession): Сессия для отправки запроса.
         stocks(list): Словарей, содержащих информацию об остатках товаров.
         campaign_id(str): Идентификатор кампании.
         access_token(str): Токен доступа к API.
@@ -72,30 +122,26 @@ def update_stocks(stocks, campaign_id, access_token):
         {'status': 'OK'}
 
     Исключения:
-        requests.exceptions.RequestException: При ошибках сетевого запроса.
-        HTTPError: При HTTP-ошибках (например, 400, 401, 500).
+        aiohttp.ClientError: При ошибках сетевого запроса.
+        aiohttp.ClientResponseError: При HTTP-ошибках (например, 400, 401, 500).
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
     payload = {"skus": stocks}
-    url = endpoint_url + f"campaigns/{campaign_id}/offers/stocks"
-    response = requests.put(url, headers=headers, json=payload)
-    response.raise_for_status()
-    response_object = response.json()
+    url = campaign_url(campaign_id, "offers/stocks")
+    async with session.put(
+        url, headers=auth_headers(access_token), json=payload
+    ) as response:
+        response.raise_for_status()
+        response_object = await response.json(loads=orjson.loads)
     return response_object
 
 
-def update_price(prices, campaign_id, access_token):
-     """Обновляет цены товаров на Яндекс.Маркете.
+async def update_price(session, prices, campaign_id, access_token):
+    """Обновляет цены товаров на Яндекс.Маркете.
 
     Функция отправляет запрос на обновление цен товаров через API Яндекс.Маркета.
 
     Аргументы:
+        session(aiohttp.ClientSession): Сессия для отправки запроса.
         prices(list): словарей, содержащих информацию о ценах товаров.
         campaign_id(str): Идентификатор кампании.
         access_token(str): Токен доступа к API.
@@ -106,21 +152,16 @@ def update_price(prices, campaign_id, access_token):
         {'status': 'OK'}
 
     Исключения:
-        requests.exceptions.RequestException: При ошибках сетевого запроса.
-        HTTPError: При HTTP-ошибках (например, 400, 401, 500).
+        aiohttp.ClientError: При ошибках сетевого запроса.
+        aiohttp.ClientResponseError: При HTTP-ошибках (например, 400, 401, 500).
     """
-    endpoint_url = "https://api.partner.market.yandex.ru/"
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {access_token}",
-        "Accept": "application/json",
-        "Host": "api.partner.market.yandex.ru",
-    }
     payload = {"offers": prices}
-    url = endpoint_url + f"campaigns/{campaign_id}/offer-prices/updates"
-    response = requests.post(url, headers=headers, json=payload)
-    response.raise_for_status()
-    response_object = response.json()
+    url = campaign_url(campaign_id, "offer-prices/updates")
+    async with session.post(
+        url, headers=auth_headers(access_token), json=payload
+    ) as response:
+        response.raise_for_status()
+        response_object = await response.json(loads=orjson.loads)
     return response_object
 
 
@@ -128,27 +169,30 @@ def get_offer_ids(campaign_id, market_token):
     """Получает список артикулов товаров из Яндекс.Маркета.
 
     Функция получает список offer_id товаров из Яндекс.Маркета.
+    Следующая страница запрашивается в фоновом потоке, пока разбирается текущая.
 
     Аргументы:
         campaign_id(str): Идентификатор кампании.
         market_token(str): Токен доступа к API Яндекс.Маркета.
 
     Возвращаемое значние:
-        list: артикулов товаров (shopSku).
+        set: артикулов товаров (shopSku).
         Пример:
-        ['123', '456', '789']
+        {'123', '456', '789'}
     """
-    page = ""
-    product_list = []
-    while True:
-        some_prod = get_product_list(page, campaign_id, market_token)
-        product_list.extend(some_prod.get("offerMappingEntries"))
-        page = some_prod.get("paging").get("nextPageToken")
-        if not page:
-            break
-    offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer").get("shopSku"))
+    offer_ids = set()
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(get_product_list, "", campaign_id, market_token)
+        while next_page is not None:
+            some_prod = next_page.result()
+            page = some_prod.get("paging").get("nextPageToken")
+            next_page = None
+            if page:
+                next_page = executor.submit(
+                    get_product_list, page, campaign_id, market_token
+                )
+            for product in some_prod.get("offerMappingEntries"):
+                offer_ids.add(product.get("offer").get("shopSku"))
     return offer_ids
 
 
@@ -159,7 +203,7 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
 
     Аргументы:
         watch_remnants(list): словарей с остатками часов.
-        offer_ids(list): артикулов товаров на Яндекс.Маркет.
+        offer_ids(set): артикулов товаров на Яндекс.Маркет.
         warehouse_id(str): Идентификатор склада.
 
     Возвращаемое значение:
@@ -170,20 +214,21 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
             {'sku': '456', 'warehouseId': 1234, 'items': [{'count': 100, 'type': 'FIT', 'updatedAt': '2023-10-27T12:00:00Z'}]},
         ]
     """
+    offer_ids = set(offer_ids)
     stocks = list()
-    date = str(datetime.datetime.utcnow().replace(microsecond=0).isoformat() + "Z")
+    date = (
+        datetime.datetime.now(datetime.timezone.utc)
+        .replace(microsecond=0)
+        .isoformat()
+        .replace("+00:00", "Z")
+    )
     for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
+        code = str(watch.get("Код"))
+        if code in offer_ids:
+            stock = stock_conversion(watch.get("Количество"))
             stocks.append(
                 {
-                    "sku": str(watch.get("Код")),
+                    "sku": code,
                     "warehouseId": warehouse_id,
                     "items": [
                         {
@@ -194,21 +239,12 @@ def create_stocks(watch_remnants, offer_ids, warehouse_id):
                     ],
                 }
             )
-            offer_ids.remove(str(watch.get("Код")))
-    # Добавим недостающее из загруженного:
+            offer_ids.discard(code)
+    # Добавим недостающее из загруженного, список items у них общий:
+    empty_items = [{"count": 0, "type": "FIT", "updatedAt": date}]
     for offer_id in offer_ids:
         stocks.append(
-            {
-                "sku": offer_id,
-                "warehouseId": warehouse_id,
-                "items": [
-                    {
-                        "count": 0,
-                        "type": "FIT",
-                        "updatedAt": date,
-                    }
-                ],
-            }
+            {"sku": offer_id, "warehouseId": warehouse_id, "items": empty_items}
         )
     return stocks
 
@@ -220,7 +256,7 @@ def create_prices(watch_remnants, offer_ids):
 
     Аргументы:
         watch_remnants(list): словарей с остатками часов.
-        offer_ids(list): артикулов товаров на Яндекс.Маркет.
+        offer_ids(set): артикулов товаров на Яндекс.Маркет.
 
     Возвращаемое значение:
         Со словарями, содержащих информацию о ценах для отправки на Яндекс.Маркет.
@@ -230,14 +266,16 @@ def create_prices(watch_remnants, offer_ids):
             {'id': '456', 'price': {'value': 10000, 'currencyId': 'RUR'}},
         ]
     """
+    offer_ids = set(offer_ids)
     prices = []
     for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
+        code = str(watch.get("Код"))
+        if code in offer_ids:
             price = {
-                "id": str(watch.get("Код")),
+                "id": code,
                 # "feed": {"id": 0},
                 "price": {
-                    "value": int(price_conversion(watch.get("Цена"))),
+                    "value": price_to_int(watch.get("Цена")),
                     # "discountBase": 0,
                     "currencyId": "RUR",
                     # "vat": 0,
@@ -249,6 +287,69 @@ def create_prices(watch_remnants, offer_ids):
     return prices
 
 
+def build_stocks_and_prices(watch_remnants, offer_ids, warehouse_id):
+    """Создает списки остатков и цен для отправки на Яндекс.Маркет за один проход.
+
+    Функция делает то же, что create_stocks и create_prices вместе:
+    один раз строит словарь остатков по коду и проходит по артикулам Яндекс.Маркета.
+
+    Аргументы:
+        watch_remnants(list): словарей с остатками часов.
+        offer_ids(set): артикулов товаров на Яндекс.Маркет.
+        warehouse_id(str): Идентификатор склада.
+
+    Возвращаемое значение:
+        tuple: содержащий список остатков и список цен для отправки на Яндекс.Маркет.
+        Пример:
+        (
+            [{'sku': '123', 'warehouseId': 1234, 'items': [{'count': 10, 'type': 'FIT', 'updatedAt': '2023-10-27T12:00:00Z'}]}],
+            [{'id': '123', 'price': {'value': 5000, 'currencyId': 'RUR'}}],
+        )
+    """
+    remnants = remnants_by_code(watch_remnants)
+    stocks = list()
+    prices = list()
+    date = (
+        datetime.datetime.now(datetime.timezone.utc)
+        .replace(microsecond=0)
+        .isoformat()
+        .replace("+00:00", "Z")
+    )
+    # У товаров, которых нет в файле остатков, список items общий:
+    empty_items = [{"count": 0, "type": "FIT", "updatedAt": date}]
+    for offer_id in offer_ids:
+        watch = remnants.get(offer_id)
+        if watch is None:
+            stocks.append(
+                {"sku": offer_id, "warehouseId": warehouse_id, "items": empty_items}
+            )
+            continue
+        stock = stock_conversion(watch.get("Количество"))
+        stocks.append(
+            {
+                "sku": offer_id,
+                "warehouseId": warehouse_id,
+                "items": [
+                    {
+                        "count": stock,
+                        "type": "FIT",
+                        "updatedAt": date,
+                    }
+                ],
+            }
+        )
+        prices.append(
+            {
+                "id": offer_id,
+                "price": {
+                    "value": price_to_int(watch.get("Цена")),
+                    "currencyId": "RUR",
+                },
+            }
+        )
+    return stocks, prices
+
+
 async def upload_prices(watch_remnants, campaign_id, market_token):
     """Загружает цены товаров на Яндекс.Маркет асинхронно.
 
@@ -269,8 +370,7 @@ async def upload_prices(watch_remnants, campaign_id, market_token):
     """
     offer_ids = get_offer_ids(campaign_id, market_token)
     prices = create_prices(watch_remnants, offer_ids)
-    for some_prices in list(divide(prices, 500)):
-        update_price(some_prices, campaign_id, market_token)
+    await upload_chunks(update_price, prices, 500, campaign_id, market_token)
     return prices
 
 
@@ -296,15 +396,14 @@ async def upload_stocks(watch_remnants, campaign_id, market_token, warehouse_id)
     """
     offer_ids = get_offer_ids(campaign_id, market_token)
     stocks = create_stocks(watch_remnants, offer_ids, warehouse_id)
-    for some_stock in list(divide(stocks, 2000)):
-        update_stocks(some_stock, campaign_id, market_token)
+    await upload_chunks(update_stocks, stocks, 2000, campaign_id, market_token)
     not_empty = list(
         filter(lambda stock: (stock.get("items")[0].get("count") != 0), stocks)
     )
     return not_empty, stocks
 
 
-def main():
+async def main_async():
     env = Env()
     market_token = env.str("MARKET_TOKEN")
     campaign_fbs_id = env.str("FBS_ID")
@@ -316,28 +415,34 @@ def main():
     try:
         # FBS
         offer_ids = get_offer_ids(campaign_fbs_id, market_token)
+        stocks, prices = build_stocks_and_prices(
+            watch_remnants, offer_ids, warehouse_fbs_id
+        )
         # Обновить остатки FBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_fbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_fbs_id, market_token)
+        await upload_chunks(update_stocks, stocks, 2000, campaign_fbs_id, market_token)
         # Поменять цены FBS
-        upload_prices(watch_remnants, campaign_fbs_id, market_token)
+        await upload_chunks(update_price, prices, 500, campaign_fbs_id, market_token)
 
         # DBS
         offer_ids = get_offer_ids(campaign_dbs_id, market_token)
+        stocks, prices = build_stocks_and_prices(
+            watch_remnants, offer_ids, warehouse_dbs_id
+        )
         # Обновить остатки DBS
-        stocks = create_stocks(watch_remnants, offer_ids, warehouse_dbs_id)
-        for some_stock in list(divide(stocks, 2000)):
-            update_stocks(some_stock, campaign_dbs_id, market_token)
+        await upload_chunks(update_stocks, stocks, 2000, campaign_dbs_id, market_token)
         # Поменять цены DBS
-        upload_prices(watch_remnants, campaign_dbs_id, market_token)
-    except requests.exceptions.ReadTimeout:
+        await upload_chunks(update_price, prices, 500, campaign_dbs_id, market_token)
+    except (requests.exceptions.ReadTimeout, asyncio.TimeoutError):
         print("Превышено время ожидания...")
-    except requests.exceptions.ConnectionError as error:
+    except (requests.exceptions.ConnectionError, aiohttp.ClientConnectionError) as error:
         print(error, "Ошибка соединения")
     except Exception as error:
         print(error, "ERROR_2")
 
 
+def main():
+    asyncio.run(main_async())
+
+
 if __name__ == "__main__":
     main()
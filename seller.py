@@ -1,17 +1,72 @@
 """Скрипт предназначен для автоматического обновления цен на маркетплейсе Озон."""
 
+import asyncio
 import io
+import itertools
 import logging.config
-import os
 import re
+import shutil
 import zipfile
+from concurrent.futures import ThreadPoolExecutor
 from environs import Env
 
-import pandas as pd
+import aiohttp
+import orjson
 import requests
+import xlrd
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 logger = logging.getLogger(__file__)
 
+UPLOAD_CONCURRENCY = 5
+STOCK_COLUMNS = ("Код", "Количество", "Цена")
+STOCK_HEADER_ROW = 17
+NON_DIGIT_RE = re.compile(r"\D", re.ASCII)
+
+
+def json_dumps(obj) -> str:
+    """Сериализует объект в JSON-строку с помощью orjson.
+
+    Используется как json_serialize для aiohttp, которому нужна строка, а не байты.
+
+    Аргументы:
+        obj: объект для сериализации.
+
+    Возвращаемое значение:
+        str: JSON-строка.
+        Пример:
+        >>> json_dumps({'prices': []})
+        '{"prices":[]}'
+    """
+    return orjson.dumps(obj).decode()
+
+
+def make_session():
+    """Создает сессию requests с пулом keep-alive соединений.
+
+    Сессия переиспользует TCP/TLS-соединения между запросами к одному хосту
+    и повторяет запрос при временных ошибках сервера (429 и 5xx), учитывая
+    заголовок Retry-After, чтобы одна ошибка не обрывала всю пагинацию.
+
+    Возвращаемое значение:
+        requests.Session: настроенная сессия.
+    """
+    session = requests.Session()
+    retry = Retry(
+        total=5,
+        backoff_factor=0.5,
+        status_forcelist=[429, 500, 502, 503, 504],
+        allowed_methods=frozenset(["GET", "POST", "PUT"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=10, pool_maxsize=20, max_retries=retry)
+    session.mount("https://", adapter)
+    return session
+
+
+SESSION = make_session()
 
 
 def get_product_list(last_id, client_id, seller_token):
@@ -55,9 +110,9 @@ def get_product_list(last_id, client_id, seller_token):
         "last_id": last_id,
         "limit": 1000,
     }
-    response = requests.post(url, json=payload, headers=headers)
+    response = SESSION.post(url, json=payload, headers=headers)
     response.raise_for_status()
-    respons_oebject = response.json()
+    response_object = orjson.loads(response.content)
     return response_object.get("result")
 
 
@@ -65,42 +120,48 @@ def get_offer_ids(client_id, seller_token):
     """Возвращает артикулы товаров магазина озон.
     Функция принимает два аргумента клиентское ID и токен продавца, создает список артикулов товаров магазина озон. 
     Функция использует функцию get_product_list для получения списка товаров магазина озон, передавая свои аргументы и аргумент last_id.
+    Следующая страница запрашивается в фоновом потоке, пока разбирается текущая.
 
     Аргументы:
         client_id(str): Идентификатор клиента Ozon.
         seller_token(str): Токен продавца Ozon.
 
     Возвращаемое значение:
-        list: со строками, где каждая строка это артикуль товара.
+        set: со строками, где каждая строка это артикуль товара.
 
         Примеры:
         >>> get_offer_ids('your_client_id', 'your_seller_token')
-        '*Артикул товара№1*', '*Артикул товара№2*', ...*'
+        {'*Артикул товара№1*', '*Артикул товара№2*', ...*}
     
         >>> get_offer_ids('empty_client_id', 'empty_seller_token')
-        []
+        set()
     """
-    last_id = ""
-    product_list = []
-    while True:
-        some_prod = get_product_list(last_id, client_id, seller_token)
-        product_list.extend(some_prod.get("items"))
-        total = some_prod.get("total")
-        last_id = some_prod.get("last_id")
-        if total == len(product_list):
-            break
-    offer_ids = []
-    for product in product_list:
-        offer_ids.append(product.get("offer_id"))
+    offer_ids = set()
+    received = 0
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_page = executor.submit(get_product_list, "", client_id, seller_token)
+        while next_page is not None:
+            some_prod = next_page.result()
+            items = some_prod.get("items")
+            received += len(items)
+            next_page = None
+            if items and some_prod.get("total") != received:
+                last_id = some_prod.get("last_id")
+                next_page = executor.submit(
+                    get_product_list, last_id, client_id, seller_token
+                )
+            for product in items:
+                offer_ids.add(product.get("offer_id"))
     return offer_ids
 
 
-def update_price(prices: list, client_id, seller_token):
+async def update_price(session, prices: list, client_id, seller_token):
     """Обновляет цены товаров на Ozon.
 
     Функция принимает список цен и учетные данные Ozon и отправляет запрос на обновление цен через API.
 
     Аргументы:
+        session(aiohttp.ClientSession): Сессия для отправки запроса.
         prices(list): со словарями, содержащих информацию о ценах товаров.
         client_id(str): Идентификатор клиента Ozon.
         seller_token(str): Токен продавца Ozon.
@@ -109,12 +170,12 @@ def update_price(prices: list, client_id, seller_token):
         dict: с результатом обновления цен.
 
     Примеры:
-        >>> update_price([{'offer_id': '123', 'price': '1000'}], 'your_client_id', 'your_seller_token')
+        >>> await update_price(session, [{'offer_id': '123', 'price': '1000'}], 'your_client_id', 'your_seller_token')
         {'result': 'ok'}
 
     Исключения:
-        requests.exceptions.RequestException: При ошибках сетевого запроса.
-        HTTPError: При HTTP-ошибках (например, 400, 401, 500).
+        aiohttp.ClientError: При ошибках сетевого запроса.
+        aiohttp.ClientResponseError: При HTTP-ошибках (например, 400, 401, 500).
     """
     url = "https://api-seller.ozon.ru/v1/product/import/prices"
     headers = {
@@ -122,17 +183,18 @@ def update_price(prices: list, client_id, seller_token):
         "Api-Key": seller_token,
     }
     payload = {"prices": prices}
-    response = requests.post(url, json=payload, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    async with session.post(url, json=payload, headers=headers) as response:
+        response.raise_for_status()
+        return await response.json(loads=orjson.loads)
 
 
-def update_stocks(stocks: list, client_id, seller_token):
+async def update_stocks(session, stocks: list, client_id, seller_token):
     """Обновляет остатки товаров на Ozon.
 
     Функция принимает список остатков и учетные данные Ozon и отправляет запрос на обновление остатков через API.
 
     Аргументы:
+        session(aiohttp.ClientSession): Сессия для отправки запроса.
         stocks(list): со словарями, содержащих информацию об остатках товаров.
         client_id(str): Идентификатор клиента Ozon.
         seller_token(str): Токен продавца Ozon.
@@ -141,12 +203,12 @@ def update_stocks(stocks: list, client_id, seller_token):
         dict: с результатом обновления остатков.
 
     Примеры:
-        >>> update_stocks([{'offer_id': '123', 'stock': 10}], 'your_client_id', 'your_seller_token')
+        >>> await update_stocks(session, [{'offer_id': '123', 'stock': 10}], 'your_client_id', 'your_seller_token')
         {'result': 'ok'}
 
     Исключения:
-        requests.exceptions.RequestException: При ошибках сетевого запроса.
-        HTTPError: При HTTP-ошибках (например, 400, 401, 500).
+        aiohttp.ClientError: При ошибках сетевого запроса.
+        aiohttp.ClientResponseError: При HTTP-ошибках (например, 400, 401, 500).
     """
     url = "https://api-seller.ozon.ru/v1/product/import/stocks"
     headers = {
@@ -154,16 +216,16 @@ def update_stocks(stocks: list, client_id, seller_token):
         "Api-Key": seller_token,
     }
     payload = {"stocks": stocks}
-    response = requests.post(url, json=payload, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    async with session.post(url, json=payload, headers=headers) as response:
+        response.raise_for_status()
+        return await response.json(loads=orjson.loads)
 
 
 def download_stock():
     """Скачивает файл остатков с сайта Casio и возвращает список остатков часов.
 
-    Функция загружает ZIP-архив с остатками, извлекает Excel-файл, 
-    обрабатывает его и возвращает список словарей, содержащих информацию об остатках.
+    Функция загружает ZIP-архив с остатками, читает Excel-файл прямо из архива
+    и возвращает список словарей с колонками "Код", "Количество" и "Цена".
 
     Возвращаемое значение:
         list: со словарями, где каждый словарь представляет остаток товара.
@@ -176,26 +238,54 @@ def download_stock():
     Исключения:
         requests.exceptions.RequestException: При ошибках скачивания файла.
         zipfile.BadZipFile: Если загруженный файл не является корректным ZIP-архивом.
-        pandas.errors.ParserError: Если Excel-файл имеет неправильный формат.
+        xlrd.XLRDError: Если Excel-файл имеет неправильный формат.
+        ValueError: Если в заголовке таблицы нет нужной колонки.
     """
     casio_url = "https://timeworld.ru/upload/files/ostatki.zip"
-    session = requests.Session()
-    response = session.get(casio_url)
-    response.raise_for_status()
-    with response, zipfile.ZipFile(io.BytesIO(response.content)) as archive:
-        archive.extractall(".")
+    with io.BytesIO() as archive_file:
+        with SESSION.get(casio_url, stream=True) as response:
+            response.raise_for_status()
+            response.raw.decode_content = True
+            shutil.copyfileobj(response.raw, archive_file)
+        with zipfile.ZipFile(archive_file) as archive:
+            excel_data = archive.read("ostatki.xls")
     # Создаем список остатков часов:
-    excel_file = "ostatki.xls"
-    watch_remnants = pd.read_excel(
-        io=excel_file,
-        na_values=None,
-        keep_default_na=False,
-        header=17,
-    ).to_dict(orient="records")
-    os.remove("./ostatki.xls")  # Удалить файл
+    sheet = xlrd.open_workbook(file_contents=excel_data).sheet_by_index(0)
+    header = sheet.row_values(STOCK_HEADER_ROW)
+    columns = {name: header.index(name) for name in STOCK_COLUMNS}
+    watch_remnants = []
+    for row in range(STOCK_HEADER_ROW + 1, sheet.nrows):
+        watch_remnants.append(
+            {
+                name: cell_conversion(sheet.cell_value(row, column))
+                for name, column in columns.items()
+            }
+        )
     return watch_remnants
 
 
+def cell_conversion(value):
+    """Преобразует значение ячейки Excel к виду, в котором его ждут остальные функции.
+
+    xlrd возвращает все числа как float, поэтому целые числа приводятся к int,
+    чтобы str(value) давал "123", а не "123.0".
+
+    Аргументы:
+        value: значение ячейки.
+
+    Возвращаемое значение:
+        Значение ячейки, целые float приведены к int.
+        Примеры:
+        >>> cell_conversion(123.0)
+        123
+        >>> cell_conversion('>10')
+        '>10'
+    """
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
 def create_stocks(watch_remnants, offer_ids):
     """Создает список остатков для отправки на Ozon.
 
@@ -204,7 +294,7 @@ def create_stocks(watch_remnants, offer_ids):
 
     Аргументы:
         watch_remnants(list): Со словарями с остатками часов.
-        offer_ids(list): артикулы товаров на Ozon.
+        offer_ids(set): артикулы товаров на Ozon.
 
     Возвращаемое значение:
         list: со словарями, содержащих информацию об остатках для отправки на Ozon.
@@ -214,18 +304,14 @@ def create_stocks(watch_remnants, offer_ids):
             {'offer_id': '456', 'stock': 100},
         ]
     """
+    offer_ids = set(offer_ids)
     stocks = []
     for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
-            count = str(watch.get("Количество"))
-            if count == ">10":
-                stock = 100
-            elif count == "1":
-                stock = 0
-            else:
-                stock = int(watch.get("Количество"))
-            stocks.append({"offer_id": str(watch.get("Код")), "stock": stock})
-            offer_ids.remove(str(watch.get("Код")))
+        code = str(watch.get("Код"))
+        if code in offer_ids:
+            stock = stock_conversion(watch.get("Количество"))
+            stocks.append({"offer_id": code, "stock": stock})
+            offer_ids.discard(code)
     # Добавим недостающее из загруженного:
     for offer_id in offer_ids:
         stocks.append({"offer_id": offer_id, "stock": 0})
@@ -240,7 +326,7 @@ def create_prices(watch_remnants, offer_ids):
 
     Аргументы:
         watch_remnants(list): Cо словарями с остатками часов.
-        offer_ids(list): артикуль товаров на Ozon.
+        offer_ids(set): артикуль товаров на Ozon.
 
     Возвращаемое значние:
         list: со словарями, содержащих информацию о ценах для отправки на Ozon.
@@ -250,13 +336,15 @@ def create_prices(watch_remnants, offer_ids):
             {'offer_id': '456', 'price': '10000', 'currency_code': 'RUB', 'old_price': '0', 'auto_action_enabled': 'UNKNOWN'},
         ]
     """
+    offer_ids = set(offer_ids)
     prices = []
     for watch in watch_remnants:
-        if str(watch.get("Код")) in offer_ids:
+        code = str(watch.get("Код"))
+        if code in offer_ids:
             price = {
                 "auto_action_enabled": "UNKNOWN",
                 "currency_code": "RUB",
-                "offer_id": str(watch.get("Код")),
+                "offer_id": code,
                 "old_price": "0",
                 "price": price_conversion(watch.get("Цена")),
             }
@@ -264,6 +352,89 @@ def create_prices(watch_remnants, offer_ids):
     return prices
 
 
+def build_stocks_and_prices(watch_remnants, offer_ids):
+    """Создает списки остатков и цен для отправки на Ozon за один проход.
+
+    Функция делает то же, что create_stocks и create_prices вместе:
+    один раз строит словарь остатков по коду и проходит по артикулам Ozon.
+
+    Аргументы:
+        watch_remnants(list): Со словарями с остатками часов.
+        offer_ids(set): артикулы товаров на Ozon.
+
+    Возвращаемое значение:
+        tuple: содержащий список остатков и список цен для отправки на Ozon.
+        Пример:
+        (
+            [{'offer_id': '123', 'stock': 10}, {'offer_id': '456', 'stock': 0}],
+            [{'offer_id': '123', 'price': '5000', 'currency_code': 'RUB', 'old_price': '0', 'auto_action_enabled': 'UNKNOWN'}],
+        )
+    """
+    remnants = remnants_by_code(watch_remnants)
+    stocks = []
+    prices = []
+    for offer_id in offer_ids:
+        watch = remnants.get(offer_id)
+        if watch is None:
+            # Добавим недостающее из загруженного:
+            stocks.append({"offer_id": offer_id, "stock": 0})
+            continue
+        stocks.append(
+            {"offer_id": offer_id, "stock": stock_conversion(watch.get("Количество"))}
+        )
+        prices.append(
+            {
+                "auto_action_enabled": "UNKNOWN",
+                "currency_code": "RUB",
+                "offer_id": offer_id,
+                "old_price": "0",
+                "price": price_conversion(watch.get("Цена")),
+            }
+        )
+    return stocks, prices
+
+
+def remnants_by_code(watch_remnants):
+    """Возвращает словарь остатков часов по коду товара.
+
+    Если код встречается в файле несколько раз, берется первая строка.
+
+    Аргументы:
+        watch_remnants(list): Со словарями с остатками часов.
+
+    Возвращаемое значение:
+        dict: где ключ это код товара строкой, а значение это строка остатков.
+        Пример:
+        >>> remnants_by_code([{'Код': 123, 'Количество': 10, 'Цена': '5000.00'}])
+        {'123': {'Код': 123, 'Количество': 10, 'Цена': '5000.00'}}
+    """
+    return {str(watch.get("Код")): watch for watch in reversed(watch_remnants)}
+
+
+def stock_conversion(quantity) -> int:
+    """Преобразует количество часов из файла остатков в остаток на маркетплейсе.
+
+    Аргументы:
+        quantity: количество из колонки "Количество".
+
+    Возвращаемое значение:
+        int: остаток для отправки на маркетплейс.
+        Примеры:
+        >>> stock_conversion('>10')
+        100
+        >>> stock_conversion(1)
+        0
+        >>> stock_conversion(5)
+        5
+    """
+    count = str(quantity)
+    if count == ">10":
+        return 100
+    if count == "1":
+        return 0
+    return int(quantity)
+
+
 def price_conversion(price: str) -> str:
     """Преобразует строку, представляющую цену, в целое число.
 
@@ -283,17 +454,38 @@ def price_conversion(price: str) -> str:
 
         Не правильно: price_conversion(3400.00)
     """
-    return re.sub("[^0-9]", "", price.split(".")[0])
+    return NON_DIGIT_RE.sub("", price.split(".", 1)[0])
+
+
+def price_to_int(price: str) -> int:
+    """Преобразует строку, представляющую цену, в целое число.
+
+    Функция делает то же, что price_conversion, но сразу возвращает int.
+    Если в целой части цены нет цифр, возвращает 0.
+
+    Аргументы:
+        str: цену для преобразования, строка.
+
+    Возвращаемое значение:
+        int: целая часть цены.
+        Примеры:
+        >>> price_to_int('5990.00 руб.')
+        5990
+        >>> price_to_int('')
+        0
+    """
+    digits = NON_DIGIT_RE.sub("", price.split(".", 1)[0])
+    return int(digits) if digits else 0
 
 
-def divide(lst: list, n: int):
+def divide(lst, n: int):
     """Разделяет список на части по n элементов.
 
-    Функция принимает список и число n и возвращает генератор, 
-    который разбивает список на части по n элементов.
+    Функция принимает список (или любой итерируемый объект) и число n и возвращает генератор, 
+    который разбивает его на части по n элементов, не создавая всех частей сразу.
 
     Аргументы:
-        lst(list): Список для разделения.
+        lst(iterable): Список для разделения.
         n(int): Размер каждой части.
 
     Возвращаемое значие:
@@ -302,8 +494,40 @@ def divide(lst: list, n: int):
         >>> list(divide([1, 2, 3, 4, 5, 6], 2))
         [[1, 2], [3, 4], [5, 6]]
     """
-    for i in range(0, len(lst), n):
-        yield lst[i : i + n]
+    iterator = iter(lst)
+    while chunk := list(itertools.islice(iterator, n)):
+        yield chunk
+
+
+async def upload_chunks(update, items, size, *args):
+    """Отправляет список частями по size элементов одновременно.
+
+    Функция открывает сессию aiohttp и параллельно отправляет все части списка
+    функцией update, ограничивая число одновременных запросов.
+
+    Аргументы:
+        update(coroutine function): Функция отправки одной части, например update_price.
+        items(list): Список для отправки.
+        size(int): Размер каждой части.
+        *args: Остальные аргументы update (идентификаторы и токены).
+
+    Возвращаемое значение:
+        list: с ответами API для каждой части.
+        Пример:
+        >>> await upload_chunks(update_price, prices, 1000, 'your_client_id', 'your_seller_token')
+        [{'result': 'ok'}, {'result': 'ok'}]
+    """
+    semaphore = asyncio.Semaphore(UPLOAD_CONCURRENCY)
+    connector = aiohttp.TCPConnector(limit=20, keepalive_timeout=30)
+    async with aiohttp.ClientSession(
+        connector=connector, json_serialize=json_dumps
+    ) as session:
+
+        async def send(chunk):
+            async with semaphore:
+                return await update(session, chunk, *args)
+
+        return await asyncio.gather(*[send(chunk) for chunk in divide(items, size)])
 
 
 async def upload_prices(watch_remnants, client_id, seller_token):
@@ -327,8 +551,7 @@ async def upload_prices(watch_remnants, client_id, seller_token):
     """
     offer_ids = get_offer_ids(client_id, seller_token)
     prices = create_prices(watch_remnants, offer_ids)
-    for some_price in list(divide(prices, 1000)):
-        update_price(some_price, client_id, seller_token)
+    await upload_chunks(update_price, prices, 1000, client_id, seller_token)
     return prices
 
 
@@ -352,34 +575,34 @@ async def upload_stocks(watch_remnants, client_id, seller_token):
     """
     offer_ids = get_offer_ids(client_id, seller_token)
     stocks = create_stocks(watch_remnants, offer_ids)
-    for some_stock in list(divide(stocks, 100)):
-        update_stocks(some_stock, client_id, seller_token)
+    await upload_chunks(update_stocks, stocks, 100, client_id, seller_token)
     not_empty = list(filter(lambda stock: (stock.get("stock") != 0), stocks))
     return not_empty, stocks
 
 
-def main():
+async def main_async():
     env = Env()
     seller_token = env.str("SELLER_TOKEN")
     client_id = env.str("CLIENT_ID")
     try:
         offer_ids = get_offer_ids(client_id, seller_token)
         watch_remnants = download_stock()
+        stocks, prices = build_stocks_and_prices(watch_remnants, offer_ids)
         # Обновить остатки
-        stocks = create_stocks(watch_remnants, offer_ids)
-        for some_stock in list(divide(stocks, 100)):
-            update_stocks(some_stock, client_id, seller_token)
+        await upload_chunks(update_stocks, stocks, 100, client_id, seller_token)
         # Поменять цены
-        prices = create_prices(watch_remnants, offer_ids)
-        for some_price in list(divide(prices, 900)):
-            update_price(some_price, client_id, seller_token)
-    except requests.exceptions.ReadTimeout:
+        await upload_chunks(update_price, prices, 900, client_id, seller_token)
+    except (requests.exceptions.ReadTimeout, asyncio.TimeoutError):
         print("Превышено время ожидания...")
-    except requests.exceptions.ConnectionError as error:
+    except (requests.exceptions.ConnectionError, aiohttp.ClientConnectionError) as error:
         print(error, "Ошибка соединения")
     except Exception as error:
         print(error, "ERROR_2")
 
 
+def main():
+    asyncio.run(main_async())
+
+
 if __name__ == "__main__":
     main()